@@ -1,10 +1,14 @@
 import json
 import os
-from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import stat
+import tempfile
 
 import numpy as np
 import pandas as pd
-from pandas.io.json import json_normalize
+try:
+    from pandas import json_normalize
+except ImportError:
+    from pandas.io.json import json_normalize
 
 
 class ActivityNet(object):
@@ -257,23 +261,10 @@ class ActivityNet(object):
             original frame-rate is not unknown
 
         """
-        for filename, subset in self._partition_segments_list:
-            df = self.segments_info(subset)
-            if 'frame-rate' not in df.columns:
-                raise ValueError(('Impossible to map annotations. '
-                                  'Update TSV-files with frame-rate info'))
-
-            df.loc[:, 't-init'] = (df.loc[:, 't-init'] * fps /
-                                   df.loc[:, 'frame-rate'])
-            df.loc[:, 't-end'] = (df.loc[:, 't-end'] * fps /
-                                  df.loc[:, 'frame-rate'])
-            df.loc[:, 'f-init'] = (fps * df.loc[:, 't-init']).astype(int)
-            df.loc[:, 'f-end'] = (fps * df.loc[:, 't-end']).astype(int)
-
-            df.to_csv(os.path.join(self.metadata, filename),
-                      sep='\t', index=None)
-
-        self.update_frame_rate(fps)
+        frame_rate = frame_rate_transform(fps)
+        self.update_metadata(
+            video_transforms=[frame_rate],
+            segment_transforms=[remap_fps_transform(fps), frame_rate])
 
     def label_to_index(self, arr, reset_index=True):
         """Return index(es) of the activity label(s) in arr.
@@ -336,19 +327,49 @@ class ActivityNet(object):
             New frame rate
 
         """
-        n_list = len(self._segments_list)
-        for i, attribute in enumerate(self._partition_segments_list +
-                                      self._segments_list):
-            filename, subset = attribute
-            if i < n_list:
-                df = self.segments_info(subset)
-            else:
-                df = self.video_info(subset)
+        frame_rate = frame_rate_transform(fps)
+        self.update_metadata(video_transforms=[frame_rate],
+                             segment_transforms=[frame_rate])
+
+    def update_metadata(self, video_transforms=None, segment_transforms=None):
+        """Apply several transformations to the TSV-files in a single pass.
+
+        Every [subset]_list.tsv and [subset]_segments_list.tsv file is read
+        once, its transformations are applied in order, and it is written
+        once. Files are only written after all of them were transformed, and
+        each one is replaced atomically (temporary file + rename).
 
-            n = len(df)
-            df.loc[:, 'frame-rate'] = fps * np.ones(n)
+        Several updates can be combined in a single pass e.g.::
+
+            num_frames = num_frames_transform('num_frames.tsv')
+            frame_rate = frame_rate_transform(30)
+            dataset.update_metadata(
+                video_transforms=[num_frames, frame_rate],
+                segment_transforms=[remap_fps_transform(30), num_frames,
+                                    frame_rate])
+
+        Parameters
+        ----------
+        video_transforms : list, optional
+            Callables taking and returning the DataFrame of [subset]_list.tsv.
+        segment_transforms : list, optional
+            Callables taking and returning the DataFrame of
+            [subset]_segments_list.tsv.
 
-            df.to_csv(filename, sep='\t', index=None)
+        """
+        updates = []
+        for files, transforms in [(self.files_video_list, video_transforms),
+                                  (self.files_seg_list, segment_transforms)]:
+            if not transforms:
+                continue
+            for filename, subset in files:
+                df = pd.read_table(filename)
+                for fn in transforms:
+                    df = fn(df)
+                updates.append((filename, df))
+
+        for filename, df in updates:
+            _atomic_to_csv(df, filename)
 
     def update_num_frames(self, filename):
         """Update num-frames field.
@@ -360,21 +381,15 @@ class ActivityNet(object):
         filename : str
             Filename of TSV file with info (video-name, num-frames) fields.
 
-        """
-        new_df = pd.read_table(filename, index_col='video-name')
-        n_list = len(self.files_video_list)
-        for i, attribute in enumerate(self.files_video_list +
-                                      self.files_seg_list):
-            filename, subset = attribute
-            if i >= n_list:
-                df = self.segments_info(subset)
-            else:
-                df = self.video_info(subset)
-
-            df.loc[:, 'num-frames'] = new_df.loc[df['video-name'],
-                                                 'num-frames'].values
+        Raises
+        ------
+        KeyError
+            videos missing in filename
 
-            df.to_csv(filename, sep='\t', index=None)
+        """
+        num_frames = num_frames_transform(filename)
+        self.update_metadata(video_transforms=[num_frames],
+                             segment_transforms=[num_frames])
 
     def video_info(self, partition='train'):
         """Return DataFrame with info about videos on the corresponding set.
@@ -395,26 +410,113 @@ class ActivityNet(object):
         return df
 
 
-if __name__ == '__main__':
-    description = ('Generate metadata about videos and segments, in the form '
-                   'of TSV-files, from ActivityNet JSON-file annotation')
-    p = ArgumentParser(description=description,
-                       formatter_class=ArgumentDefaultsHelpFormatter)
-    p.add_argument('-d', '--metadata-dir', required=True,
-                   help='Dirname of ActivityNet metadata folder')
-    p.add_argument('-f', '--filename', required=True,
-                   help='Filename of ActivityNet JSON-file annotations')
-    p.add_argument('-e', '--extra-info-filename', default='none.tsv',
-                   help='Filename of ActivityNet TSV-file with extra info')
-    p.add_argument('-r', '--remap-fps', default=None, type=int,
-                   help='Re-map instance annotations into specific FPS')
-    args = p.parse_args()
+def frame_rate_transform(fps):
+    """Return transformation setting frame-rate column to fps.
+
+    It applies to videos and segments tables, see
+    `ActivityNet.update_metadata`.
 
+    """
+    def frame_rate(df):
+        df['frame-rate'] = float(fps)
+        return df
+    return frame_rate
+
+
+def num_frames_transform(filename):
+    """Return transformation joining num-frames column from a TSV-file.
+
+    It applies to videos and segments tables, see
+    `ActivityNet.update_metadata`. The transformation raises KeyError if a
+    video is missing in the TSV-file.
+
+    Parameters
+    ----------
+    filename : str
+        Filename of TSV file with info (video-name, num-frames) fields.
+
+    """
+    num_frames = pd.read_table(filename, index_col='video-name')['num-frames']
+
+    def join_num_frames(df):
+        values = df['video-name'].map(num_frames)
+        if values.isnull().any():
+            missing = df.loc[values.isnull(), 'video-name'].unique()
+            raise KeyError('Unknown num-frames for {}'.format(
+                ', '.join(missing[:10])))
+        df['num-frames'] = values.astype(int)
+        return df
+    return join_num_frames
+
+
+def remap_fps_transform(fps):
+    """Return transformation remapping segments annotations to fps.
+
+    It only applies to segments tables, see `ActivityNet.update_metadata`.
+    The transformation raises ValueError if frame-rate column is missing.
+
+    """
+    def remap(df):
+        if 'frame-rate' not in df.columns:
+            raise ValueError(('Impossible to map annotations. '
+                              'Update TSV-files with frame-rate info'))
+        ratio = fps / df['frame-rate']
+        df['t-init'] = df['t-init'] * ratio
+        df['t-end'] = df['t-end'] * ratio
+        df['f-init'] = (fps * df['t-init']).astype(int)
+        df['f-end'] = (fps * df['t-end']).astype(int)
+        return df
+    return remap
+
+
+def main(metadata_dir, filename, extra_info_filename='none.tsv',
+         remap_fps=None):
+    """Generate TSV-files with metadata from ActivityNet JSON-file."""
     # Instanciate class to create metadata ;)
-    dummy = ActivityNet(metadata_dir=args.metadata_dir,
-                        annotation_file=args.filename,
-                        extra_file=args.extra_info_filename)
+    dummy = ActivityNet(metadata_dir=metadata_dir,
+                        annotation_file=filename,
+                        extra_file=extra_info_filename)
 
-    if args.remap_fps:
+    if remap_fps:
         print('Annotations have been re-mapped into different FPS')
-        dummy.remap_annotations(args.remap_fps)
+        dummy.remap_annotations(remap_fps)
+
+
+def _atomic_to_csv(df, filename):
+    """Write TSV-file such that a crash never leaves it half-written.
+
+    Permissions of an existent file are preserved. Otherwise, the file is
+    created with the usual permissions given the umask.
+
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    if os.path.exists(filename):
+        mode = stat.S_IMODE(os.stat(filename).st_mode)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fobj:
+            df.to_csv(fobj, sep='\t', index=None)
+            fobj.flush()
+            os.fsync(fobj.fileno())
+        os.chmod(tmp_filename, mode)
+        os.rename(tmp_filename, filename)
+    except Exception:
+        os.remove(tmp_filename)
+        raise
+
+    # Persist the rename itself
+    dir_fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+if __name__ == '__main__':
+    from c3d_misc import main as c3d_misc_main
+    c3d_misc_main(subcommand='activitynet')
@@ -0,0 +1,162 @@
+"""Time pipeline stages over synthetic inputs at several scales.
+
+Every measurement is appended as a JSON line into the results file, thus
+successive runs can be compared e.g. with pandas.read_json(lines=True).
+"""
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import synthetic  # noqa: E402
+from activitynet import ActivityNet  # noqa: E402
+import check_c3d_list  # noqa: E402
+import dump_hdf5  # noqa: E402
+from utilities import (dense_video_sampling, iou,  # noqa: E402
+                       iter_pool_dataset_features)
+
+
+def timeit(fn, repeat=3):
+    """Return best wall time, in seconds, of `repeat` calls to fn."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.time()
+        fn()
+        times.append(time.time() - start_time)
+    return min(times)
+
+
+def bench_read_feature(workdir, scale, repeat):
+    video_names = synthetic.blob_dirs(workdir, num_videos=1, num_clips=scale)
+    dirname = os.path.join(workdir, video_names[0])
+    filenames = dump_hdf5.blob_files(dirname, 'fc6-1')
+    return timeit(lambda: [dump_hdf5.read_feature(i) for i in filenames],
+                  repeat)
+
+
+def bench_dump_hdf5(workdir, scale, repeat):
+    root_dir = os.path.join(workdir, 'blobs')
+    synthetic.blob_dirs(root_dir, num_videos=scale, num_clips=20)
+    output_file = os.path.join(workdir, 'features.hdf5')
+    return timeit(lambda: dump_hdf5.main(root_dir, output_file,
+                                         freq_interval=0), repeat)
+
+
+def bench_check_c3d_list(workdir, scale, repeat):
+    num_frames, t_res = 160, 16
+    video_names = ['v_video{:07d}'.format(i) for i in range(scale)]
+    synthetic.frame_dirs(workdir, video_names, num_frames=num_frames)
+    txt_file = os.path.join(workdir, 'input.lst')
+    with open(txt_file, 'w') as fid:
+        for video in video_names:
+            for f_init in range(1, num_frames - t_res + 1, t_res):
+                fid.write('{} {}\n'.format(os.path.join(workdir, video),
+                                           f_init))
+    return timeit(lambda: check_c3d_list.main(
+        txt_file, output_flag=False, check_all_frames=True, t_res=t_res,
+        imgfmt='{0:06d}.png', layer='.fc6-1', no_stop=True), repeat)
+
+
+def bench_dense_video_sampling(workdir, scale, repeat):
+    videos, annotations = synthetic.video_tables(num_videos=scale)
+    return timeit(lambda: dense_video_sampling(videos, annotations), repeat)
+
+
+def bench_iou(workdir, scale, repeat):
+    rng = np.random.RandomState(0)
+    target = np.sort(rng.randint(0, 10000, (100, 2)), axis=1)
+    test = np.sort(rng.randint(0, 10000, (scale, 2)), axis=1)
+    return timeit(lambda: iou(target, test), repeat)
+
+
+def bench_pool_dataset_features(workdir, scale, repeat):
+    # 1000 proposals per video over fc6-like features. Videos share the same
+    # array as the cost does not depend on the values.
+    num_frames = (900, 7200)
+    videos, proposals = synthetic.video_tables(
+        num_videos=max(scale // 1000, 1), num_frames=num_frames,
+        num_annotations=1000)
+    arr = np.random.RandomState(0).rand(num_frames[1] // 16, 4096)
+    features = dict.fromkeys(videos['video-name'], arr.astype(np.float32))
+
+    def pool():
+        # Descriptors are dropped video by video, they do not fit in memory
+        for _ in iter_pool_dataset_features(features, proposals):
+            pass
+    return timeit(pool, repeat)
+
+
+def bench_activitynet(workdir, scale, repeat):
+    annotation_file = os.path.join(workdir, 'activity_net.json')
+    extra_file = os.path.join(workdir, 'extra_info.tsv')
+    synthetic.activitynet_json(annotation_file, num_videos=scale,
+                               extra_file=extra_file)
+
+    def generate_metadata():
+        metadata_dir = tempfile.mkdtemp(dir=workdir)
+        ActivityNet(metadata_dir, annotation_file, extra_file)
+        shutil.rmtree(metadata_dir)
+    return timeit(generate_metadata, repeat)
+
+
+BENCHMARKS = {
+    'read_feature': (bench_read_feature, [100, 1000, 5000]),
+    'dump_hdf5': (bench_dump_hdf5, [10, 50, 200]),
+    'check_c3d_list': (bench_check_c3d_list, [10, 100, 500]),
+    'dense_video_sampling': (bench_dense_video_sampling, [100, 1000, 5000]),
+    'iou': (bench_iou, [1000, 100000, 1000000]),
+    'activitynet': (bench_activitynet, [100, 1000, 10000]),
+    'pool_dataset_features': (bench_pool_dataset_features,
+                              [10000, 100000, 1000000]),
+}
+
+
+def main(output_file, benchmarks, scales_factor, repeat, tag):
+    """Run benchmarks and append results into output_file."""
+    for name in benchmarks:
+        fn, scales = BENCHMARKS[name]
+        for scale in scales:
+            scale = max(int(scale * scales_factor), 1)
+            workdir = tempfile.mkdtemp()
+            try:
+                seconds = fn(workdir, scale, repeat)
+            finally:
+                shutil.rmtree(workdir)
+            record = dict(benchmark=name, scale=scale, seconds=seconds,
+                          repeat=repeat, tag=tag, timestamp=time.time(),
+                          python=platform.python_version(),
+                          numpy=np.__version__)
+            print('{benchmark}\tscale: {scale}\t{seconds:.4f}s'.format(
+                **record))
+            with open(output_file, 'a') as fid:
+                fid.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    description = 'Benchmark C3D-misc pipeline with synthetic data'
+    p = ArgumentParser(description=description,
+                       formatter_class=ArgumentDefaultsHelpFormatter)
+    p.add_argument('-o', '--output-file', default='bench_output.jsonl',
+                   help='JSON-lines file where results are appended')
+    p.add_argument('-b', '--benchmarks', nargs='+',
+                   default=sorted(BENCHMARKS), choices=sorted(BENCHMARKS),
+                   help='Benchmarks to run')
+    p.add_argument('-sf', '--scales-factor', default=1.0, type=float,
+                   help='Multiply default scales by this factor')
+    p.add_argument('-n', '--repeat', default=3, type=int,
+                   help='Number of runs per scale, best one is reported')
+    p.add_argument('-t', '--tag', default='',
+                   help='Label for this run e.g. commit or branch name')
+
+    main(**vars(p.parse_args()))
@@ -0,0 +1,107 @@
+"""Enforce an import-time budget on the c3d_misc entry point.
+
+It exits with non-zero status if starting c3d_misc.py takes longer than the
+budget, or if it imports a heavy module that the command does not need.
+Besides the top-level help, it runs a real subcommand, packing an empty
+root folder as a flat shard, which must not import h5py or pandas.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['h5py', 'numpy', 'pandas']
+
+
+def startup_time(args, repeat=5):
+    """Return best wall time, in seconds, to run a python process."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.check_call([sys.executable] + args, cwd=ROOT,
+                              stdout=subprocess.PIPE)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def heavy_imports(argv):
+    """Return heavy modules loaded by running c3d_misc with argv."""
+    fid, modules_file = tempfile.mkstemp(suffix='.json')
+    os.close(fid)
+    # --help exits once the usage is printed
+    code = ('import json, sys, c3d_misc\n'
+            'try:\n'
+            '    c3d_misc.main({!r})\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'json.dump(sorted(sys.modules), open({!r}, "w"))\n'.format(
+                argv, modules_file))
+    try:
+        subprocess.check_call([sys.executable, '-c', code], cwd=ROOT,
+                              stdout=subprocess.PIPE)
+        with open(modules_file, 'r') as f:
+            modules = json.load(f)
+    finally:
+        os.remove(modules_file)
+    return [i for i in HEAVY_MODULES if i in modules]
+
+
+def main(budget, dispatch_budget, repeat, output_file):
+    workdir = tempfile.mkdtemp()
+    try:
+        root_dir = os.path.join(workdir, 'blobs')
+        os.makedirs(root_dir)
+        # (name, arguments, budget, heavy modules it needs)
+        commands = [
+            ('--help', ['--help'], budget, []),
+            ('dump-hdf5 -of flat',
+             ['dump-hdf5', '-r', root_dir, '-of', 'flat', '-fqi', '0',
+              '-o', os.path.join(workdir, 'shard')], dispatch_budget,
+             ['numpy']),
+        ]
+        baseline = startup_time(['-c', 'pass'], repeat)
+        status = 0
+        for name, argv, max_overhead, allowed in commands:
+            seconds = startup_time(['c3d_misc.py'] + argv, repeat)
+            heavy = [i for i in heavy_imports(argv) if i not in allowed]
+            record = dict(benchmark='startup', command=name,
+                          seconds=seconds, overhead=seconds - baseline,
+                          budget=max_overhead, heavy=heavy,
+                          timestamp=time.time())
+            print('c3d_misc.py {}: {:.4f}s (interpreter: {:.4f}s, budget: '
+                  '{:.4f}s)'.format(name, seconds, baseline, max_overhead))
+            if output_file:
+                with open(output_file, 'a') as fid:
+                    fid.write(json.dumps(record) + '\n')
+
+            if heavy:
+                print('Heavy modules imported: {}'.format(heavy))
+                status = 1
+            if seconds - baseline > max_overhead:
+                print('Startup overhead exceeds budget')
+                status = 1
+    finally:
+        shutil.rmtree(workdir)
+    return status
+
+
+if __name__ == '__main__':
+    description = 'Measure startup time of c3d_misc.py'
+    p = ArgumentParser(description=description,
+                       formatter_class=ArgumentDefaultsHelpFormatter)
+    p.add_argument('-b', '--budget', default=0.1, type=float,
+                   help='Seconds allowed on top of a bare interpreter')
+    p.add_argument('-db', '--dispatch-budget', default=0.5, type=float,
+                   help=('Seconds allowed on top of a bare interpreter to '
+                         'run dump-hdf5 over an empty folder'))
+    p.add_argument('-n', '--repeat', default=5, type=int,
+                   help='Number of runs, best one is reported')
+    p.add_argument('-o', '--output-file', default=None,
+                   help='JSON-lines file where results are appended')
+
+    sys.exit(main(**vars(p.parse_args())))
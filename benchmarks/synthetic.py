@@ -0,0 +1,149 @@
+"""Generate synthetic inputs resembling ActivityNet and C3D outputs."""
+import array
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def activitynet_json(filename, num_videos=100, num_annotations=3,
+                     num_labels=200, extra_file=None, frame_rate=30.0,
+                     seed=0):
+    """Write JSON-file with the same layout of ActivityNet ground-truth.
+
+    Parameters
+    ----------
+    filename : str
+        Fullpath of JSON-file to create.
+    num_videos : int
+        Number of videos. They are split 50/25/25 among training, validation
+        and testing subsets.
+    num_annotations : int
+        Number of annotations per video.
+    num_labels : int
+        Number of activity categories.
+    extra_file : str, optional
+        If given, write TSV-file with video-name, frame-rate and num-frames
+        of every video.
+    frame_rate : float
+        Frame rate of all the videos.
+    seed : int
+        Seed of random number generator.
+
+    Returns
+    -------
+    video_info : pandas.DataFrame
+        Table with video-name, duration, frame-rate and num-frames.
+
+    """
+    rng = np.random.RandomState(seed)
+    labels = ['activity-{:03d}'.format(i) for i in range(num_labels)]
+    subsets = ['training', 'validation', 'testing']
+    database, rows = {}, []
+    for i in range(num_videos):
+        video_id = 'video{:07d}'.format(i)
+        subset = subsets[min(max(i * 4 // num_videos - 1, 0), 2)]
+        duration = float(rng.uniform(30, 240))
+        annotations = []
+        for j in range(num_annotations):
+            t_init = rng.uniform(0, duration * 0.9)
+            t_end = rng.uniform(t_init, duration)
+            annotations.append({'segment': [t_init, t_end],
+                                'label': labels[rng.randint(num_labels)]})
+        database[video_id] = {'subset': subset, 'duration': duration,
+                              'resolution': '640x360',
+                              'url': 'https://youtu.be/' + video_id,
+                              'annotations': annotations}
+        rows.append(('v_' + video_id, duration, frame_rate,
+                     int(duration * frame_rate)))
+
+    with open(filename, 'w') as fid:
+        json.dump({'version': 'synthetic', 'database': database}, fid)
+
+    video_info = pd.DataFrame(rows, columns=['video-name', 'duration',
+                                             'frame-rate', 'num-frames'])
+    if extra_file is not None:
+        video_info.to_csv(extra_file, sep='\t', index=None)
+    return video_info
+
+
+def video_tables(num_videos=100, num_frames=(900, 7200), num_annotations=3,
+                 num_labels=200, seed=0):
+    """Return tables in the format expected by `dense_video_sampling`.
+
+    Returns
+    -------
+    videos : pandas.DataFrame
+        Table with video-name and num-frames columns.
+    annotations : pandas.DataFrame
+        Table with video-name, f-init, f-end and idx-label columns.
+
+    """
+    rng = np.random.RandomState(seed)
+    names = ['v_video{:07d}'.format(i) for i in range(num_videos)]
+    frames = rng.randint(num_frames[0], num_frames[1], num_videos)
+    videos = pd.DataFrame({'video-name': names, 'num-frames': frames})
+
+    n = num_videos * num_annotations
+    f_init = rng.randint(0, frames.min() // 2, n)
+    f_end = f_init + rng.randint(16, frames.min() // 2, n)
+    annotations = pd.DataFrame(
+        {'video-name': np.repeat(names, num_annotations),
+         'f-init': f_init, 'f-end': f_end,
+         'idx-label': rng.randint(num_labels, size=n)})
+    return videos, annotations
+
+
+def frame_dirs(root, video_names, num_frames=160, imgfmt='{0:06d}.png'):
+    """Create a folder of empty frames for each video."""
+    for video in video_names:
+        dirname = os.path.join(root, video)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        for j in range(1, num_frames + 1):
+            open(os.path.join(dirname, imgfmt.format(j)), 'w').close()
+
+
+def write_blob(filename, data):
+    """Write ndarray as C3D blob i.e. 5-int header followed by float32.
+
+    Parameters
+    ----------
+    filename : str
+        Fullpath of file to create.
+    data : ndarray
+        5d-ndarray with layout [num, channels, length, height, width].
+
+    """
+    s_parr = array.array('i', data.shape)
+    with open(filename, 'wb') as fid:
+        s_parr.tofile(fid)
+        data.astype(np.float32).tofile(fid)
+
+
+def blob_dirs(root, num_videos=10, num_clips=50, layers=['fc6-1'], dim=4096,
+              t_stride=16, seed=0):
+    """Create a folder per video with the C3D blobs of its clips.
+
+    Blob names follow the output list created by scripts/format_list.sh i.e.
+    [root]/[video-name]/[f-init].[layer].
+
+    Returns
+    -------
+    video_names : list
+        Name of the videos created.
+
+    """
+    rng = np.random.RandomState(seed)
+    video_names = ['v_video{:07d}'.format(i) for i in range(num_videos)]
+    for video in video_names:
+        dirname = os.path.join(root, video)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        for j in range(num_clips):
+            prefix = os.path.join(dirname, '{:06d}'.format(j * t_stride + 1))
+            for layer in layers:
+                data = rng.rand(1, dim, 1, 1, 1).astype(np.float32)
+                write_blob('{}.{}'.format(prefix, layer), data)
+    return video_names
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+"""Single entry point for the C3D-misc programs.
+
+Usage: c3d_misc.py [subcommand] [arguments]
+
+Only argparse is imported at startup. The module of a subcommand, and its
+heavy dependencies (numpy, pandas, h5py), are imported once the subcommand
+is known.
+"""
+import importlib
+import os
+import sys
+from argparse import (ArgumentParser, ArgumentDefaultsHelpFormatter,
+                      ArgumentTypeError)
+
+
+def _layer_dtype(value):
+    """Parse layer:dtype argument. dump_hdf5.main validates the dtype."""
+    layer, sep, dtype = value.rpartition(':')
+    if not sep or not layer or not dtype:
+        raise ArgumentTypeError('expected layer:dtype, got {}'.format(value))
+    return layer, dtype
+
+
+def _activitynet_args(p):
+    p.add_argument('-d', '--metadata-dir', required=True,
+                   help='Dirname of ActivityNet metadata folder')
+    p.add_argument('-f', '--filename', required=True,
+                   help='Filename of ActivityNet JSON-file annotations')
+    p.add_argument('-e', '--extra-info-filename', default='none.tsv',
+                   help='Filename of ActivityNet TSV-file with extra info')
+    p.add_argument('-r', '--remap-fps', default=None, type=int,
+                   help='Re-map instance annotations into specific FPS')
+
+
+def _check_c3d_blobs_args(p):
+    p.add_argument('-r', '--root-dir', required=True,
+                   help='Dirname of root allocation features per video')
+    p.add_argument('-l', '--layers', nargs='+', default=['fc6-1'],
+                   help='layer extracted which corresponds to file extension')
+    p.add_argument('-n', '--num-workers', default=16, type=int,
+                   help='Number of threads reading headers')
+    p.add_argument('-rf', '--report-file', default='blobs_report.tsv',
+                   help='TSV-file with status of every video and layer')
+    p.add_argument('-tf', '--retry-file', default='blobs_retry.lst',
+                   help='Output list of broken blobs to extract again')
+
+
+def _check_c3d_list_args(p):
+    p.add_argument('-i', '--txt-file', required=True,
+                   help='Input/Output list given to extract features')
+    p.add_argument('-o', '--output-flag', action='store_true',
+                   help='txt-file is an output list')
+    p.add_argument('-c', '--check-all-frames', action='store_false',
+                   help='Ensure all frames requested by a line are there')
+    p.add_argument('-l', '--t-res', default=16, type=int,
+                   help='temporal length of the clips')
+    p.add_argument('-f', '--imgfmt', default='{0:06d}.png',
+                   help='Image format')
+    p.add_argument('-of', '--layer', default='.fc6-1',
+                   help='Extracted layer')
+    p.add_argument('-ns', '--no-stop', action='store_true',
+                   help='Nop stop at first error')
+
+
+def _clip_generation_args(p):
+    p.add_argument('-ds', '--dataset-name', default='activitynet',
+                   choices=['activitynet', 'Thumos14'])
+    p.add_argument('-d', '--dir-metadata', required=True,
+                   help='Root folder of dataset containing medatada folder')
+    p.add_argument('-w', '--t-res', default=16, type=int,
+                   help='temporal length of the clips')
+    p.add_argument('-s', '--t-stride', default=None, type=int,
+                   help=('temporal stride used to extract clips. 16 for '
+                         'dense, 64 for adaptive sampling if not given'))
+    p.add_argument('-bl', '--bckg-label', default=200, type=int,
+                   help='Integer label for background instances')
+    p.add_argument('-sm', '--sampling', default='dense',
+                   choices=['dense', 'adaptive'],
+                   help=('Fixed stride, or fine stride around action '
+                         'boundaries and t-stride elsewhere'))
+    p.add_argument('-fs', '--fine-stride', default=8, type=int,
+                   help=('temporal stride close to boundaries (adaptive), '
+                         'smaller than t-stride'))
+    p.add_argument('-m', '--margin', default=32, type=int,
+                   help='frames around boundaries sampled with fine-stride')
+    p.add_argument('-sc', '--scores-file', default=None,
+                   help=('TSV-file with video-name, f-init and score columns. '
+                         'Required by adaptive sampling to find boundaries '
+                         'of non-training subsets'))
+    p.add_argument('-br', '--bckg-ratio', default=None, type=float,
+                   help='Fraction of background clips to keep per video')
+    p.add_argument('-mc', '--max-clips', default=None, type=int,
+                   help='Maximum number of clips per video')
+    p.add_argument('-b', '--budget', default=None, type=int,
+                   help='Maximum number of clips per subset, stratified '
+                        'by label')
+    p.add_argument('-sd', '--seed', default=0, type=int,
+                   help='Seed used to subsample clips')
+    p.add_argument('-ss', '--subsample-subsets', nargs='+', default=None,
+                   help=('Subsets where bckg-ratio, max-clips and budget '
+                         'apply. Only the training subset if not given'))
+
+
+def _dump_hdf5_args(p):
+    p.add_argument('-r', '--root-dir', required=True,
+                   help='Dirname of root allocation features per video')
+    p.add_argument('-o', '--output-file', required=True,
+                   help='Name of hdf5 file (or flat shard folder) to create')
+    p.add_argument('-l', '--layers', nargs='+', default=['fc6-1'],
+                   help='layer extracted which corresponds to file extension')
+    p.add_argument('-of', '--output-format', default='hdf5',
+                   choices=['hdf5', 'flat'],
+                   help='Store features in HDF5 or as a flat shard folder')
+    p.add_argument('-sd', '--storage-dtypes', nargs='+', default=[],
+                   type=_layer_dtype,
+                   help=('Data type used to store a layer given as '
+                         'layer:dtype e.g. fc6-1:uint8. See '
+                         'quantization.STORAGE_DTYPES'))
+    p.add_argument('-h5m', '--hdf5_mode', default='w',
+                   help='Mode used to open HDF5 output file')
+    p.add_argument('-nsh', '--num-shards', default=1, type=int,
+                   help='Split videos, by name, in this number of shards')
+    p.add_argument('-si', '--shard-id', default=0, type=int,
+                   help='Shard to pack, from 0 to num-shards - 1')
+    p.add_argument('-nr', '--num-readers', default=0, type=int,
+                   help='Threads reading blobs of next videos ahead')
+    p.add_argument('-mif', '--max-in-flight', default=8, type=int,
+                   help='Maximum number of videos read ahead')
+    p.add_argument('-mm', '--max-memory', default=1024, type=int,
+                   help='Maximum MB of features read ahead')
+    p.add_argument('-fqi', '--freq-interval', type=int, default=20,
+                   help='Frequency interval to write progress')
+    p.add_argument('-sf', '--stats-file', default=None,
+                   help='JSON-file to save a summary of timing and throughput')
+    p.add_argument('-ns', '--no-stats', action='store_true',
+                   help='Disable per-stage timing and throughput counters')
+
+
+def _merge_hdf5_args(p):
+    p.add_argument('-i', '--shard-files', nargs='+', required=True,
+                   help='HDF5-files of each shard')
+    p.add_argument('-o', '--output-file', required=True,
+                   help='Name of hdf5 file to create')
+    p.add_argument('-lk', '--link', default='external',
+                   choices=['external', 'virtual'],
+                   help='Index shards with external links or virtual datasets')
+
+
+def _hdf5_to_flat_args(p):
+    p.add_argument('-i', '--hdf5-file', required=True,
+                   help='HDF5-file created by dump_hdf5.py')
+    p.add_argument('-o', '--dirname', required=True,
+                   help='Folder of flat shard to create')
+    p.add_argument('-l', '--layers', nargs='+', default=None,
+                   help='Layers to convert. All of them by default')
+
+
+# subcommand: (description, arguments, module, function)
+SUBCOMMANDS = {
+    'activitynet': (
+        ('Generate metadata about videos and segments, in the form of '
+         'TSV-files, from ActivityNet JSON-file annotation'),
+        _activitynet_args, 'activitynet', 'main'),
+    'check-c3d-blobs': (
+        'Check C3D blobs reading their headers, before packing them',
+        _check_c3d_blobs_args, 'check_c3d_blobs', 'main'),
+    'check-c3d-list': (
+        'Check missing inputs (frames) or outputs (features)',
+        _check_c3d_list_args, 'check_c3d_list', 'main'),
+    'clip-generation': (
+        'Create list used by C3D binaries',
+        _clip_generation_args, 'clip_generation', 'main'),
+    'dump-hdf5': (
+        'Save C3D features as HDF5',
+        _dump_hdf5_args, 'dump_hdf5', 'main'),
+    'merge-hdf5': (
+        'Index HDF5-files of several shards into a single file',
+        _merge_hdf5_args, 'dump_hdf5', 'merge_shards'),
+    'hdf5-to-flat': (
+        'Convert HDF5-file with C3D features into a flat shard',
+        _hdf5_to_flat_args, 'feature_shard', 'hdf5_to_flat'),
+}
+
+
+def build_parser(subcommand=None, prog=None):
+    """Return ArgumentParser with a subparser per subcommand.
+
+    If `subcommand` is given, return a parser of that subcommand alone named
+    `prog` e.g. to parse arguments of a standalone script.
+
+    """
+    if subcommand is not None:
+        description, add_arguments = SUBCOMMANDS[subcommand][:2]
+        p = ArgumentParser(prog=prog, description=description,
+                           formatter_class=ArgumentDefaultsHelpFormatter)
+        add_arguments(p)
+        p.set_defaults(subcommand=subcommand)
+        return p
+
+    p = ArgumentParser(prog=prog, description='C3D-misc programs')
+    subparsers = p.add_subparsers(dest='subcommand')
+    subparsers.required = True
+    for name in sorted(SUBCOMMANDS):
+        description, add_arguments = SUBCOMMANDS[name][:2]
+        sp = subparsers.add_parser(
+            name, description=description, help=description,
+            formatter_class=ArgumentDefaultsHelpFormatter)
+        add_arguments(sp)
+    return p
+
+
+def main(argv=None, subcommand=None):
+    """Parse arguments and run the corresponding subcommand.
+
+    Standalone scripts pass their `subcommand`, then argv only has its
+    arguments and usage messages show the name of the script.
+
+    """
+    prog = None
+    if subcommand is not None:
+        prog = os.path.basename(sys.argv[0])
+    args = vars(build_parser(subcommand, prog).parse_args(argv))
+    _, _, module_name, function_name = SUBCOMMANDS[args.pop('subcommand')]
+    if module_name in ['check_c3d_blobs', 'check_c3d_list']:
+        dirname = os.path.dirname(os.path.abspath(__file__))
+        sys.path.insert(0, os.path.join(dirname, 'scripts'))
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name)(**args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,37 @@
-from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import pandas as pd
 
 from activitynet import ActivityNet
 import dataset
-from utilities import dense_video_sampling
+from utilities import (adaptive_video_sampling, dense_video_sampling,
+                       subsample_clips)
 
+# Subset used to train models on each dataset
+TRAINING_SUBSETS = {'activitynet': ['train'], 'Thumos14': ['val']}
 
-def main(dataset_name, dir_metadata, **kwargs):
-    """Create list of clips and its annotations."""
+
+def main(dataset_name, dir_metadata, sampling='dense', t_stride=None,
+         fine_stride=8, margin=32, bckg_ratio=None, max_clips=None,
+         budget=None, seed=0, subsample_subsets=None, scores_file=None,
+         **kwargs):
+    """Create list of clips and its annotations.
+
+    sampling is "dense" (fixed stride) or "adaptive" i.e. fine_stride within
+    margin frames around action boundaries, see
+    `utilities.adaptive_video_sampling`. By default, t_stride is 16 frames
+    for dense and 64 frames (coarse stride) for adaptive sampling.
+
+    Adaptive sampling takes the boundaries of the training subset (see
+    TRAINING_SUBSETS) from its annotations. Boundaries of the other subsets
+    come from the coarse scores in `scores_file`, a TSV-file with video-name,
+    f-init and score columns, such that evaluation lists do not leak the
+    ground-truth.
+
+    bckg_ratio, max_clips, budget and seed control the subset of the clips
+    to extract, see `utilities.subsample_clips`. They only apply to the
+    lists of `subsample_subsets`, by default the training subset (see
+    TRAINING_SUBSETS), such that evaluation lists remain complete.
+
+    """
     if dataset_name == 'activitynet':
         dset = ActivityNet(dir_metadata)
         ds_subsets = ['train', 'val']
@@ -15,27 +40,44 @@ def main(dataset_name, dir_metadata, **kwargs):
         dset = dset_class(dir_metadata)
         ds_subsets = dset.subsets
 
+    training_subsets = TRAINING_SUBSETS[dataset_name]
+    if subsample_subsets is None:
+        subsample_subsets = training_subsets
+    if t_stride is None:
+        t_stride = 64 if sampling == 'adaptive' else 16
+
+    scores = None
+    if sampling == 'adaptive':
+        eval_subsets = [i for i in ds_subsets if i not in training_subsets]
+        if eval_subsets and scores_file is None:
+            raise ValueError('Adaptive sampling of {} requires scores_file, '
+                             'annotations are only used for {}'.format(
+                                 eval_subsets, training_subsets))
+        if scores_file is not None:
+            scores = pd.read_csv(scores_file, sep='\t')
+
     for subset in ds_subsets:
         videos = dset.video_info(subset)
         annotations = dset.segments_info(subset)
-        clips = dense_video_sampling(videos, annotations, **kwargs)
+        if sampling == 'adaptive':
+            if subset in training_subsets:
+                boundaries_from = 'annotations'
+            else:
+                boundaries_from = 'scores'
+            clips = adaptive_video_sampling(
+                videos, annotations, scores, t_stride=t_stride,
+                fine_stride=fine_stride, margin=margin,
+                boundaries_from=boundaries_from, **kwargs)
+        else:
+            clips = dense_video_sampling(videos, annotations,
+                                         t_stride=t_stride, **kwargs)
+        if subset in subsample_subsets:
+            clips = subsample_clips(clips, kwargs.get('bckg_label', 201),
+                                    bckg_ratio, max_clips, budget, seed)
         filename = subset + '.lst'
         clips.to_csv(filename, sep=' ', header=None, index=None)
 
 
 if __name__ == '__main__':
-    description = 'Create list used by C3D binaries'
-    p = ArgumentParser(description=description,
-                       formatter_class=ArgumentDefaultsHelpFormatter)
-    p.add_argument('-ds', '--dataset-name', default='activitynet',
-                   choices=['activitynet', 'Thumos14'])
-    p.add_argument('-d', '--dir-metadata', required=True,
-                   help='Root folder of dataset containing medatada folder')
-    p.add_argument('-w', '--t-res', default=16, type=int,
-                   help='temporal length of the clips')
-    p.add_argument('-s', '--t-stride', default=16, type=int,
-                   help='temporal stride used to extract clips')
-    p.add_argument('-bl', '--bckg-label', default=200, type=int,
-                   help='Integer label for background instances')
-
-    main(**vars(p.parse_args()))
+    from c3d_misc import main as c3d_misc_main
+    c3d_misc_main(subcommand='clip-generation')
@@ -1,12 +1,20 @@
+from collections import deque
+from functools import partial
+from multiprocessing.pool import ThreadPool
 import array
 import glob
+import json
 import os
-import time
-from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import zlib
 
-import h5py
 import numpy as np
 
+from feature_shard import FlatShardWriter
+from instrumentation import PipelineMonitor
+from quantization import (dequantize, merge_errors, parameter_name,
+                          PARAMETERS, quantize, read_parameters,
+                          reconstruction_error, STORAGE_DTYPES)
+
 
 def read_feature(filename, keep_shape=False):
     """Read feature (a.k.a blob) dump by C3D.
@@ -43,75 +51,395 @@ def read_feature(filename, keep_shape=False):
     return feature, s
 
 
-def read_all_features_video(dirname, layer, dtype=np.float32, keep_shape=True):
-    """Stack all the blobs from inside a folder into a numpy array"""
+def blob_files(dirname, layer):
+    """Return sorted list of blobs of a given layer inside a folder.
+
+    Raises
+    ------
+    IOError
+        dirname does not exist
+
+    """
     if not os.path.exists(dirname):
         raise IOError('Unexistent folder {}'.format(dirname))
+    return sorted(glob.glob(os.path.join(dirname, '*' + layer)))
 
-    c3d_files = glob.glob(os.path.join(dirname, '*' + layer))
-    if len(c3d_files) == 0:
-        print('No files to read for: {}'.format(os.path.basename(dirname)))
-        return
-    sorted_files = sorted(c3d_files)
-    # Initialize ndarray
-    data, s = read_feature(sorted_files[0], keep_shape)
-    s[0] = len(sorted_files)
+
+def stack_features(filenames, dtype=np.float32, keep_shape=True):
+    """Stack blobs from a list of files into a numpy array"""
+    data, s = read_feature(filenames[0], keep_shape)
+    s[0] = len(filenames)
     arr = np.empty(tuple(s), dtype=dtype)
     arr[0, ...] = data
 
     # Read features
-    for i, v in enumerate(sorted_files[1::]):
+    for i, v in enumerate(filenames[1::]):
         data, _ = read_feature(v, keep_shape)
         arr[i + 1, ...] = data
     return arr
 
 
+def read_all_features_video(dirname, layer, dtype=np.float32, keep_shape=True):
+    """Stack all the blobs from inside a folder into a numpy array"""
+    sorted_files = blob_files(dirname, layer)
+    if len(sorted_files) == 0:
+        print('No files to read for: {}'.format(os.path.basename(dirname)))
+        return
+    return stack_features(sorted_files, dtype, keep_shape)
+
+
+def read_video(root_dir, video, layers, monitor=None):
+    """Read blobs of several layers of a video.
+
+    Parameters
+    ----------
+    root_dir : str
+        Dirname of root allocation features per video.
+    video : str
+        Name of the video i.e. subfolder of root_dir.
+    layers : list
+        Layers to read.
+    monitor : PipelineMonitor, optional
+        Monitor timing scan and read stages.
+
+    Returns
+    -------
+    blobs : list
+        Tuples (layer, num-files, ndarray). ndarray is None for layers
+        without files.
+
+    """
+    if monitor is None:
+        monitor = PipelineMonitor(freq_interval=0, enabled=False)
+    blobs = []
+    for l in layers:
+        with monitor.stage('scan'):
+            c3d_files = blob_files(os.path.join(root_dir, video), l)
+        if len(c3d_files) == 0:
+            print('No files to read for: {}'.format(video))
+            blobs.append((l, 0, None))
+            continue
+
+        with monitor.stage('read'):
+            arr = stack_features(c3d_files, dtype=np.float32)
+        blobs.append((l, len(c3d_files), arr))
+    return blobs
+
+
+class ReadAhead(object):
+    """Iterate over (item, fn(item)) computing fn ahead with a thread pool.
+
+    Results are yielded in the same order of the items. At most
+    `max_in_flight` items are being processed, waiting to be consumed or held
+    by the consumer, and new items are not submitted if the estimated memory
+    of all of them (running mean of `nbytes`) exceeds `max_bytes`. Until the
+    size of the first result is known, a single item is submitted. It hides
+    I/O latency e.g. reading blobs from NFS, behind the work of the consumer.
+
+    """
+    def __init__(self, fn, items, num_workers=4, max_in_flight=8,
+                 max_bytes=2**30, nbytes=None, monitor=None):
+        """Initialize read-ahead.
+
+        Parameters
+        ----------
+        fn : callable
+            Function to apply to every item. It runs in a thread.
+        items : iterable
+            Items to process.
+        num_workers : int
+            Number of threads.
+        max_in_flight : int
+            Maximum number of items submitted but not consumed, including
+            the one held by the consumer.
+        max_bytes : int
+            Memory cap, in bytes, of the results submitted but not consumed,
+            including the one held by the consumer.
+        nbytes : callable, optional
+            Return size in bytes of an output of fn.
+        monitor : PipelineMonitor, optional
+            The time blocked waiting for results is counted as "read" stage.
+
+        """
+        self.fn = fn
+        self.items = items
+        self.num_workers = num_workers
+        self.max_in_flight = max(max_in_flight, 1)
+        self.max_bytes = max_bytes
+        self.nbytes = nbytes
+        if monitor is None:
+            monitor = PipelineMonitor(freq_interval=0, enabled=False)
+        self.monitor = monitor
+
+    def _can_submit(self, pending, num_done, avg_bytes):
+        """Return True if one more item fits on top of `pending` ones."""
+        if pending + 1 > self.max_in_flight:
+            return False
+        if self.nbytes is None:
+            return True
+        if num_done == 0:
+            return False
+        return (pending + 1) * avg_bytes <= self.max_bytes
+
+    def __iter__(self):
+        pool = ThreadPool(self.num_workers)
+        window, items = deque(), iter(self.items)
+        avg_bytes, num_done, exhausted = 0.0, 0, False
+        # Result yielded in previous iteration, still held by the consumer
+        held = 0
+        try:
+            while True:
+                # An empty window always gets an item to make progress
+                while not exhausted and (
+                        not window or self._can_submit(
+                            len(window) + held, num_done, avg_bytes)):
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    window.append((item, pool.apply_async(self.fn, (item,))))
+                if not window:
+                    break
+
+                item, result = window.popleft()
+                with self.monitor.stage('read'):
+                    value = result.get()
+                if self.nbytes is not None:
+                    num_done += 1
+                    avg_bytes += (self.nbytes(value) - avg_bytes) / num_done
+                held = 1
+                yield item, value
+                del value
+        finally:
+            pool.terminate()
+
+
+def _blobs_nbytes(blobs):
+    return sum(arr.nbytes for _, _, arr in blobs if arr is not None)
+
+
+def read_hdf5_features(f, video, layer, dtype=np.float32):
+    """Read features of a video from HDF5-file created by `main`.
+
+    Quantized features are decoded on the fly.
+
+    Parameters
+    ----------
+    f : h5py.File
+        Opened HDF5-file.
+    video : str
+        Name of the video.
+    layer : str
+        Name of the layer.
+    dtype : numpy.dtype, optional
+        Data type of output.
+
+    """
+    name = 'c3d_{}'.format(layer)
+    return dequantize(f[video][name][()], read_parameters(f[video], name),
+                      dtype)
+
+
+class HDF5Writer(object):
+    """Write features into HDF5-file with a GROUP per video."""
+    def __init__(self, filename, mode='w'):
+        import h5py
+
+        self.compression_flags = dict(compression="gzip", compression_opts=9)
+        self.f = h5py.File(filename, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def add(self, video, layer, arr, attrs=None):
+        """Store features of a video into DATASET c3d_{layer}.
+
+        Quantization parameters (scale, offset) are saved as DATASETs
+        c3d_{layer}_{parameter}, the rest of attrs as attributes of the
+        DATASET.
+
+        """
+        if video not in self.f:
+            g = self.f.create_group(video)
+        else:
+            g = self.f[video]
+        name = 'c3d_{}'.format(layer)
+        dataset = g.create_dataset(name, data=arr, chunks=True,
+                                   **self.compression_flags)
+        for key, value in (attrs or {}).items():
+            if key in PARAMETERS:
+                g.create_dataset(parameter_name(name, key), data=value)
+            else:
+                dataset.attrs[key] = value
+
+    def close(self):
+        self.f.close()
+
+
+def _check_shard(num_shards, shard_id):
+    if num_shards < 1 or not 0 <= shard_id < num_shards:
+        raise ValueError('shard_id must be in [0, {}), got {}'.format(
+            num_shards, shard_id))
+
+
+def shard_videos(video_names, num_shards=1, shard_id=0):
+    """Return sorted subset of videos assigned to a shard.
+
+    Assignment only depends on the video name (CRC32), thus all the nodes
+    agree on it without communication.
+
+    Raises
+    ------
+    ValueError
+        shard_id is not in [0, num_shards).
+
+    """
+    _check_shard(num_shards, shard_id)
+    return sorted(i for i in video_names
+                  if zlib.crc32(i.encode('utf-8')) % num_shards == shard_id)
+
+
+def merge_shards(shard_files, output_file, link='external'):
+    """Create HDF5-file indexing the videos of several shards.
+
+    Feature data is not copied.
+
+    Parameters
+    ----------
+    shard_files : list
+        HDF5-files created by `main` with different shard_id.
+    output_file : str
+        Fullpath of HDF5-file to create.
+    link : str
+        "external" adds an external link per video GROUP. "virtual" creates
+        a virtual dataset per DATASET, including quantization parameters,
+        and copies its attributes.
+
+    Raises
+    ------
+    ValueError
+        A video is present in more than one shard.
+
+    """
+    import h5py
+
+    dirname = os.path.dirname(os.path.abspath(output_file))
+    with h5py.File(output_file, 'w') as f:
+        for shard_file in shard_files:
+            # Paths relative to output allow to move the whole folder
+            rel_file = os.path.relpath(os.path.abspath(shard_file), dirname)
+            with h5py.File(shard_file, 'r') as fs:
+                for video in fs:
+                    if video in f:
+                        raise ValueError('Duplicated video {} in {}'.format(
+                            video, shard_file))
+                    if link == 'external':
+                        f[video] = h5py.ExternalLink(rel_file, video)
+                        continue
+
+                    g = f.create_group(video)
+                    for name, dataset in fs[video].items():
+                        layout = h5py.VirtualLayout(shape=dataset.shape,
+                                                    dtype=dataset.dtype)
+                        layout[...] = h5py.VirtualSource(
+                            rel_file, dataset.name, shape=dataset.shape)
+                        vds = g.create_virtual_dataset(name, layout)
+                        for key, value in dataset.attrs.items():
+                            vds.attrs[key] = value
+
+
 def main(root_dir, output_file, layers=['fc6-1'], hdf5_mode='w',
-         freq_interval=10):
+         freq_interval=10, stats_file=None, no_stats=False,
+         output_format='hdf5', storage_dtypes=None, num_shards=1,
+         shard_id=0, num_readers=0, max_in_flight=8, max_memory=1024):
     """Save C3D-blob binaries as HDF5.
 
     It recursively save all the blobs from one layer inside a root folder
     into an HDF5. It creates a GROUP for each subfolder inside the root and
     stores the blob into a DATASET name c3d_{layer}.
 
+    If `output_format` is "flat", features are stored as a flat shard (see
+    feature_shard.py) in the folder `output_file` instead.
+
+    `storage_dtypes` is a dict (or list of pairs) mapping layers to the data
+    type used to store them (see quantization.py); float32 is the default.
+    They are checked before opening the output.
+    The reconstruction error of quantized layers is reported at the end.
+
+    With `num_shards` > 1, only the videos assigned to `shard_id` are packed
+    (see `shard_videos`). Run it once per shard e.g. on each node, and
+    combine the outputs with `merge_shards`.
+
+    With `num_readers` > 0, blobs of the next videos are read by a pool of
+    threads while the current one is compressed and written (see
+    `ReadAhead`). At most `max_in_flight` videos, or `max_memory` MB, are
+    read ahead. In this case, "read" stage only counts the time blocked
+    waiting for blobs.
+
+    Progress is reported as JSON lines every `freq_interval` videos. Unless
+    `no_stats` is set, it includes the time spent on each stage (scan, read,
+    quantize, write i.e. gzip and HDF5), the number of files, bytes and clips
+    processed, and throughput.
+
     """
-    compression_flags = dict(compression="gzip", compression_opts=9)
-    with h5py.File(output_file, hdf5_mode) as f:
-        video_names = os.listdir(root_dir)
-        n_videos = len(video_names)
-        cum_time = 0
-        for i, video_it in enumerate(video_names):
-            start_time = time.time()
-            for l in layers:
-                arr = read_all_features_video(
-                    os.path.join(root_dir, video_it), l, dtype=np.float32)
+    storage_dtypes = dict(storage_dtypes or {})
+    for l, storage_dtype in storage_dtypes.items():
+        if storage_dtype not in STORAGE_DTYPES:
+            raise ValueError('Unsupported storage dtype {} for {}'.format(
+                storage_dtype, l))
+
+    # Before opening the output, which may truncate it
+    _check_shard(num_shards, shard_id)
+
+    monitor = PipelineMonitor(freq_interval=freq_interval,
+                              enabled=not no_stats)
+    errors = dict((l, {}) for l in layers
+                  if storage_dtypes.get(l, 'float32') != 'float32')
+    if output_format == 'flat':
+        writer = FlatShardWriter(output_file)
+    else:
+        writer = HDF5Writer(output_file, hdf5_mode)
+    with writer:
+        with monitor.stage('scan'):
+            video_names = shard_videos(os.listdir(root_dir), num_shards,
+                                       shard_id)
+        monitor.total = len(video_names)
+        if num_readers > 0:
+            videos = ReadAhead(
+                partial(read_video, root_dir, layers=layers), video_names,
+                num_readers, max_in_flight, max_memory * 2**20,
+                nbytes=_blobs_nbytes, monitor=monitor)
+        else:
+            videos = ((i, read_video(root_dir, i, layers, monitor))
+                      for i in video_names)
+
+        for video_it, blobs in videos:
+            for l, num_files, arr in blobs:
+                if arr is None:
+                    continue
+                monitor.add(files=num_files, nbytes=arr.nbytes,
+                            clips=arr.shape[0])
+
                 if arr.size > 0:
-                    if video_it not in f:
-                        g = f.create_group(video_it)
-                    else:
-                        g = f[video_it]
-                    g.create_dataset('c3d_{}'.format(l), data=arr,
-                                     chunks=True, **compression_flags)
-            iter_time = time.time() - start_time
-            cum_time += iter_time
-            if (i + 1) % freq_interval == 0:
-                msg = 'Iter: {}/{}\tElapsed time: {}'
-                print(msg.format(i + 1, n_videos, cum_time))
+                    with monitor.stage('quantize'):
+                        data, attrs = quantize(
+                            arr, storage_dtypes.get(l, 'float32'))
+                        if l in errors:
+                            merge_errors(errors[l], reconstruction_error(
+                                arr, data, attrs))
+                    with monitor.stage('write'):
+                        writer.add(video_it, l, data, attrs)
+            monitor.step()
+    if errors:
+        print(json.dumps({'reconstruction-error': errors}))
+    monitor.summary(stats_file, extra={'reconstruction-error': errors})
 
 
 if __name__ == '__main__':
-    description = 'Save C3D features as HDF5'
-    p = ArgumentParser(description=description,
-                       formatter_class=ArgumentDefaultsHelpFormatter)
-    p.add_argument('-r', '--root-dir', required=True,
-                   help='Dirname of root allocation features per video')
-    p.add_argument('-o', '--output-file', required=True,
-                   help='Name of hdf5 file to create')
-    p.add_argument('-l', '--layers', nargs='+', default=['fc6-1'],
-                   help='layer extracted which corresponds to file extension')
-    p.add_argument('-h5m', '--hdf5_mode', default='w',
-                   help='Mode used to open HDF5 output file')
-    p.add_argument('-fqi', '--freq-interval', type=int, default=20,
-                   help='Frequency interval to write progress')
-
-    main(**vars(p.parse_args()))
+    from c3d_misc import main as c3d_misc_main
+    c3d_misc_main(subcommand='dump-hdf5')
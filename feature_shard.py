@@ -0,0 +1,250 @@
+"""Flat, memory-mappable storage of C3D features.
+
+A shard is a folder with:
+
+- c3d_{layer}.bin : features of all the videos stacked along the first axis
+  as a contiguous raw array.
+- index.json : for every layer, dtype and shape of a clip feature plus the
+  list of videos and offsets such that the clips of the i-th video are
+  [offsets[i], offsets[i + 1]).
+- c3d_{layer}.scale.bin, c3d_{layer}.offset.bin : only for layers quantized
+  as uint8 (see quantization.py). Row i has the parameters of i-th video.
+
+Reading a range of clips is a zero-copy slice of a `numpy.memmap`. Memory
+maps opened in read mode are shared by forked processes through the page
+cache, thus a shard can be opened in the parent before forking data loader
+workers.
+"""
+import json
+import os
+
+import numpy as np
+
+from quantization import dequantize, is_parameter, read_parameters
+
+INDEX_FILENAME = 'index.json'
+
+
+def _data_filename(dirname, layer, suffix=''):
+    return os.path.join(dirname, 'c3d_{}{}.bin'.format(layer, suffix))
+
+
+class FlatShardWriter(object):
+    """Append features of videos into a flat shard."""
+    def __init__(self, dirname):
+        """Initialize writer.
+
+        Parameters
+        ----------
+        dirname : str
+            Fullpath of folder to create. Existent shard files are overwritten.
+
+        """
+        self.dirname = dirname
+        if not os.path.isdir(self.dirname):
+            os.makedirs(self.dirname)
+        self.index = {}
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def add(self, video, layer, arr, attrs=None):
+        """Append features of a video.
+
+        Parameters
+        ----------
+        video : str
+            Name of the video.
+        layer : str
+            Name of the layer.
+        arr : ndarray
+            Features with layout [num-clips, ...]. dtype and trailing shape
+            must be the same for all the videos of a given layer.
+        attrs : dict, optional
+            Quantization parameters returned by `quantization.quantize`.
+
+        Raises
+        ------
+        ValueError
+            dtype or shape mismatch with previous videos of the layer.
+
+        """
+        arr = np.ascontiguousarray(arr)
+        quantized = attrs is not None and 'scale' in attrs
+        if layer not in self.index:
+            self.index[layer] = dict(dtype=arr.dtype.str,
+                                     shape=list(arr.shape[1:]),
+                                     quantized=quantized,
+                                     videos=[], offsets=[0])
+            suffixes = ['', '.scale', '.offset'] if quantized else ['']
+            self._files[layer] = [
+                open(_data_filename(self.dirname, layer, i), 'wb')
+                for i in suffixes]
+        info = self.index[layer]
+        if (np.dtype(info['dtype']) != arr.dtype or
+                list(arr.shape[1:]) != info['shape'] or
+                info['quantized'] != quantized):
+            raise ValueError('Mismatch of dtype or shape for {} in {}'.format(
+                video, layer))
+
+        arr.tofile(self._files[layer][0])
+        if quantized:
+            for fid, key in zip(self._files[layer][1:], ['scale', 'offset']):
+                np.asarray(attrs[key], dtype=np.float32).tofile(fid)
+        info['videos'].append(video)
+        info['offsets'].append(info['offsets'][-1] + arr.shape[0])
+
+    def close(self):
+        """Flush data and write index."""
+        for files in self._files.values():
+            for fid in files:
+                fid.close()
+        self._files = {}
+        with open(os.path.join(self.dirname, INDEX_FILENAME), 'w') as fid:
+            json.dump(self.index, fid)
+
+
+class FlatShard(object):
+    """Read-only access to a flat shard."""
+    def __init__(self, dirname):
+        """Initialize shard.
+
+        Parameters
+        ----------
+        dirname : str
+            Fullpath of shard folder.
+
+        Raises
+        ------
+        IOError
+            dirname is not a shard.
+
+        """
+        filename = os.path.join(dirname, INDEX_FILENAME)
+        if not os.path.isfile(filename):
+            raise IOError('Unexistent shard index {}'.format(filename))
+        self.dirname = dirname
+        with open(filename, 'r') as fid:
+            self.index = json.load(fid)
+        self._lookup = {}
+        for layer, info in self.index.items():
+            self._lookup[layer] = dict(
+                (v, i) for i, v in enumerate(info['videos']))
+        self._memmaps = {}
+
+    @property
+    def layers(self):
+        return sorted(self.index)
+
+    def memmap(self, layer, suffix=''):
+        """Return memory map with the features of all videos of a layer.
+
+        Parameters
+        ----------
+        layer : str
+            Name of the layer.
+        suffix : str, optional
+            Use '.scale' or '.offset' to get the quantization parameters
+            (one row per video) of a quantized layer.
+
+        """
+        key = layer + suffix
+        if key not in self._memmaps:
+            info = self.index[layer]
+            if suffix:
+                shape = [len(info['videos'])] + info['shape']
+                dtype = np.float32
+            else:
+                shape = [info['offsets'][-1]] + info['shape']
+                dtype = np.dtype(info['dtype'])
+            self._memmaps[key] = np.memmap(
+                _data_filename(self.dirname, layer, suffix), mode='r',
+                dtype=dtype, shape=tuple(shape))
+        return self._memmaps[key]
+
+    def offsets(self, video, layer):
+        """Return first and last+1 row of a video in the layer memory map.
+
+        Raises
+        ------
+        KeyError
+            video or layer are not in the shard.
+
+        """
+        i = self._lookup[layer][video]
+        offsets = self.index[layer]['offsets']
+        return offsets[i], offsets[i + 1]
+
+    def videos(self, layer):
+        """Return list of videos with features of a layer."""
+        return list(self.index[layer]['videos'])
+
+    def read(self, video, layer, start=None, stop=None, dtype=np.float32):
+        """Return features of a video.
+
+        If the layer is stored with the requested dtype, the output is a view
+        of the memory map. Otherwise, features are decoded into a new array.
+
+        Parameters
+        ----------
+        video : str
+            Name of the video.
+        layer : str
+            Name of the layer.
+        start, stop : int, optional
+            Range of clips of interest.
+        dtype : numpy.dtype, optional
+            Data type of output. Use None to get the stored features as they
+            are i.e. without dequantization.
+
+        """
+        begin, end = self.offsets(video, layer)
+        clips = slice(start, stop).indices(end - begin)
+        data = self.memmap(layer)[begin + clips[0]:begin + clips[1]]
+        if dtype is None:
+            return data
+
+        attrs = None
+        if self.index[layer].get('quantized', False):
+            i = self._lookup[layer][video]
+            attrs = {'scale': self.memmap(layer, '.scale')[i],
+                     'offset': self.memmap(layer, '.offset')[i]}
+        return dequantize(data, attrs, dtype)
+
+
+def hdf5_to_flat(hdf5_file, dirname, layers=None):
+    """Convert HDF5-file created by dump_hdf5 into a flat shard.
+
+    Parameters
+    ----------
+    hdf5_file : str
+        Fullpath of HDF5-file with a GROUP per video and DATASETs c3d_{layer}.
+    dirname : str
+        Fullpath of shard folder to create.
+    layers : list, optional
+        Layers to convert. By default, all of them.
+
+    """
+    import h5py
+
+    prefix = 'c3d_'
+    with h5py.File(hdf5_file, 'r') as f, FlatShardWriter(dirname) as writer:
+        for video in f:
+            g = f[video]
+            for name, dataset in g.items():
+                layer = name[len(prefix):]
+                if is_parameter(name) or (layers is not None and
+                                          layer not in layers):
+                    continue
+                writer.add(video, layer, dataset[()],
+                           read_parameters(g, name))
+
+
+if __name__ == '__main__':
+    from c3d_misc import main as c3d_misc_main
+    c3d_misc_main(subcommand='hdf5-to-flat')
@@ -0,0 +1,150 @@
+import json
+import sys
+import time
+from collections import OrderedDict
+
+
+class _NullStage(object):
+    """Context manager doing nothing. Used when monitor is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class _Stage(object):
+    """Context manager accumulating elapsed time of a pipeline stage."""
+    def __init__(self, monitor, name):
+        self.monitor = monitor
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = time.perf_counter() - self.start
+        stages = self.monitor.stages
+        stages[self.name] = stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class PipelineMonitor(object):
+    """Time stages and measure throughput of a pipeline over videos.
+
+    Typical usage::
+
+        monitor = PipelineMonitor(total=len(videos))
+        for video in videos:
+            with monitor.stage('read'):
+                arr = read(video)
+            monitor.add(files=1, nbytes=arr.nbytes, clips=arr.shape[0])
+            monitor.step()
+        monitor.summary('stats.json')
+
+    Attributes
+    ----------
+    stages : OrderedDict
+        Cumulative wall time (seconds) spent on each stage.
+    counters : OrderedDict
+        Cumulative number of files, bytes and clips processed.
+
+    """
+    def __init__(self, total=None, freq_interval=10, enabled=True,
+                 stream=None):
+        """Initialize monitor.
+
+        Parameters
+        ----------
+        total : int, optional
+            Number of items (videos) to process. Used to estimate ETA.
+        freq_interval : int, optional
+            Emit a progress record every `freq_interval` items. Set it to 0
+            to disable periodic progress.
+        enabled : bool, optional
+            If False, stages and counters are not recorded. Only the number
+            of items processed is tracked.
+        stream : file, optional
+            File-like object where JSON-lines progress is written. Default is
+            stdout.
+
+        """
+        self.total = total
+        self.freq_interval = freq_interval
+        self.enabled = enabled
+        self.stream = stream if stream is not None else sys.stdout
+        self.stages = OrderedDict()
+        self.counters = OrderedDict([('files', 0), ('bytes', 0),
+                                     ('clips', 0)])
+        self.items = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, files=0, nbytes=0, clips=0):
+        """Increase counters of files, bytes and clips processed."""
+        if not self.enabled:
+            return
+        self.counters['files'] += files
+        self.counters['bytes'] += nbytes
+        self.counters['clips'] += clips
+
+    def progress(self):
+        """Return dict with current progress, throughput and ETA."""
+        elapsed = time.perf_counter() - self.start_time
+        record = OrderedDict([('items', self.items), ('total', self.total),
+                              ('elapsed', elapsed)])
+        if self.enabled:
+            seconds = elapsed if elapsed > 0 else float('inf')
+            record['MB/s'] = self.counters['bytes'] / 1e6 / seconds
+            record['clips/s'] = self.counters['clips'] / seconds
+            record.update(self.counters)
+            record['stages'] = OrderedDict(self.stages)
+        if self.total and self.items > 0:
+            eta = elapsed / self.items * (self.total - self.items)
+            record['eta'] = max(eta, 0.0)
+        return record
+
+    def stage(self, name):
+        """Return context manager which times a stage of the pipeline.
+
+        Parameters
+        ----------
+        name : str
+            Identifier of the stage e.g. scan, read, write.
+
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def step(self, n=1):
+        """Mark `n` items as processed and emit progress if it is time."""
+        self.items += n
+        if self.freq_interval and self.items % self.freq_interval == 0:
+            self.emit()
+
+    def emit(self):
+        """Write progress as a JSON line into stream."""
+        self.stream.write(json.dumps(self.progress()) + '\n')
+        self.stream.flush()
+
+    def summary(self, filename=None, extra=None):
+        """Return final progress record and optionally dump it as JSON.
+
+        Parameters
+        ----------
+        filename : str, optional
+            Fullpath of JSON-file to save summary.
+        extra : dict, optional
+            Additional fields to include in the summary.
+
+        """
+        record = self.progress()
+        record.update(extra or {})
+        if filename is not None:
+            with open(filename, 'w') as fid:
+                json.dump(record, fid, indent=2)
+        return record
@@ -0,0 +1,122 @@
+"""Compact storage of features as float16 or 8-bit integers.
+
+uint8 quantization is affine and per-dimension i.e. every feature dimension
+has its own scale and offset computed over the clips of a video:
+
+    feature ~= scale * code + offset
+
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+STORAGE_DTYPES = ['float32', 'float16', 'uint8']
+# Per-dimension parameters of uint8. In HDF5, they are too large for
+# attributes thus they are stored as DATASETs next to the features.
+PARAMETERS = ['scale', 'offset']
+
+
+def quantize(arr, storage_dtype='float32'):
+    """Encode features in a compact data type.
+
+    Parameters
+    ----------
+    arr : ndarray
+        Features with layout [num-clips, ...].
+    storage_dtype : str
+        ('float32', 'float16' or 'uint8') data type used to store features.
+
+    Returns
+    -------
+    data : ndarray
+        Encoded features.
+    attrs : dict
+        Parameters required to decode the features. For uint8, scale and
+        offset have the shape of a single clip feature.
+
+    Raises
+    ------
+    ValueError
+        Unsupported storage_dtype.
+
+    """
+    if storage_dtype not in STORAGE_DTYPES:
+        raise ValueError('Unsupported storage dtype {}'.format(storage_dtype))
+    attrs = {'storage-dtype': storage_dtype}
+    if storage_dtype != 'uint8':
+        return arr.astype(storage_dtype, copy=False), attrs
+
+    offset = arr.min(axis=0).astype(np.float32)
+    scale = ((arr.max(axis=0) - offset) / 255.0).astype(np.float32)
+    scale[scale == 0] = 1.0
+    data = np.rint((arr - offset) / scale).clip(0, 255).astype(np.uint8)
+    attrs['scale'], attrs['offset'] = scale, offset
+    return data, attrs
+
+
+def dequantize(data, attrs=None, dtype=np.float32):
+    """Decode features encoded with `quantize`.
+
+    Parameters
+    ----------
+    data : ndarray
+        Encoded features.
+    attrs : dict-like, optional
+        Parameters returned by `quantize`. If it lacks scale and offset,
+        data is only casted.
+    dtype : numpy.dtype
+        Data type of the decoded features.
+
+    """
+    if attrs is None or 'scale' not in attrs:
+        return data.astype(dtype, copy=False)
+    arr = data.astype(dtype)
+    arr *= np.asarray(attrs['scale'], dtype=dtype)
+    arr += np.asarray(attrs['offset'], dtype=dtype)
+    return arr
+
+
+def parameter_name(name, key):
+    """Return name of the DATASET with parameter `key` of DATASET `name`."""
+    return '{}_{}'.format(name, key)
+
+
+def is_parameter(name):
+    """Return True if DATASET `name` stores quantization parameters."""
+    return any(name.endswith('_' + key) for key in PARAMETERS)
+
+
+def read_parameters(group, name):
+    """Return parameters of DATASET `name` stored next to it in `group`.
+
+    Returns
+    -------
+    attrs : dict
+        Quantization parameters. None if features are not quantized.
+
+    """
+    attrs = dict((key, group[parameter_name(name, key)][()])
+                 for key in PARAMETERS
+                 if parameter_name(name, key) in group)
+    return attrs or None
+
+
+def reconstruction_error(arr, data, attrs):
+    """Return dict with max-abs-error, sum of squared error and count."""
+    err = np.abs(dequantize(data, attrs, np.float64) - arr)
+    return OrderedDict([('max-abs-error', float(err.max())),
+                        ('sse', float((err ** 2).sum())),
+                        ('count', int(err.size))])
+
+
+def merge_errors(summary, error):
+    """Accumulate output of `reconstruction_error` into summary (dict)."""
+    if not summary:
+        summary.update(error)
+    else:
+        summary['max-abs-error'] = max(summary['max-abs-error'],
+                                       error['max-abs-error'])
+        summary['sse'] += error['sse']
+        summary['count'] += error['count']
+    summary['rmse'] = float(np.sqrt(summary['sse'] / summary['count']))
+    return summary
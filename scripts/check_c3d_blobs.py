@@ -0,0 +1,109 @@
+from collections import Counter
+from multiprocessing.pool import ThreadPool
+import glob
+import os
+import struct
+
+HEADER_FORMAT = '5i'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FLOAT_SIZE = 4
+
+
+def check_blob(filename):
+    """Validate a C3D blob reading only its header.
+
+    Parameters
+    ----------
+    filename : str
+        Fullpath of blob.
+
+    Returns
+    -------
+    shape : tuple
+        Shape reported in the header. None if the header is broken.
+    error : str
+        Description of the problem. None if the blob is fine.
+
+    """
+    try:
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+    except (IOError, OSError) as e:
+        return None, str(e)
+
+    if len(header) < HEADER_SIZE:
+        return None, 'truncated header'
+    shape = struct.unpack(HEADER_FORMAT, header)
+    if min(shape) <= 0:
+        return shape, 'invalid shape {}'.format(shape)
+
+    num_elements = 1
+    for i in shape:
+        num_elements *= i
+    expected = HEADER_SIZE + FLOAT_SIZE * num_elements
+    if size != expected:
+        return shape, 'size {} != expected {}'.format(size, expected)
+    return shape, None
+
+
+def main(root_dir, layers, num_workers, report_file, retry_file):
+    """Validate blobs of all the videos inside a root folder.
+
+    It writes a TSV-file with a row per video and layer, and a list with
+    the prefix of every broken blob (same format of the output list given to
+    C3D) such that they can be extracted again.
+
+    """
+    video_names = sorted(os.listdir(root_dir))
+    tasks, counts = [], {}
+    for video in video_names:
+        for layer in layers:
+            files = sorted(glob.glob(os.path.join(root_dir, video,
+                                                  '*' + layer)))
+            counts[(video, layer)] = len(files)
+            tasks += [(video, layer, i) for i in files]
+
+    pool = ThreadPool(num_workers)
+    results = pool.map(check_blob, [i[2] for i in tasks], chunksize=64)
+    pool.close()
+
+    # Most common shape of a layer is taken as reference
+    shapes = dict((layer, Counter()) for layer in layers)
+    for (video, layer, _), (shape, error) in zip(tasks, results):
+        if error is None:
+            shapes[layer][shape] += 1
+    ref_shape = dict((layer, c.most_common(1)[0][0])
+                     for layer, c in shapes.items() if c)
+
+    errors = dict((key, []) for key in counts)
+    for (video, layer, filename), (shape, error) in zip(tasks, results):
+        if error is None and shape != ref_shape[layer]:
+            error = 'shape {} != {}'.format(shape, ref_shape[layer])
+        if error is not None:
+            errors[(video, layer)].append((filename, error))
+
+    broken = 0
+    with open(report_file, 'w') as fr, open(retry_file, 'w') as ft:
+        fr.write('video-name\tlayer\tnum-files\tnum-errors\terror\n')
+        for video in video_names:
+            for layer in layers:
+                video_errors = errors[(video, layer)]
+                message = video_errors[0][1] if video_errors else ''
+                if counts[(video, layer)] == 0:
+                    message = 'no files'
+                fr.write('{}\t{}\t{}\t{}\t{}\n'.format(
+                    video, layer, counts[(video, layer)], len(video_errors),
+                    message))
+                for filename, _ in video_errors:
+                    ft.write(filename[:-len(layer)].rstrip('.') + '\n')
+                broken += len(video_errors)
+    print('Checked {} blobs, {} broken'.format(len(tasks), broken))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    from c3d_misc import main as c3d_misc_main
+    c3d_misc_main(subcommand='check-c3d-blobs')
@@ -1,4 +1,3 @@
-from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 import os
 
 import pandas as pd
@@ -34,22 +33,8 @@ def main(txt_file, output_flag, check_all_frames, t_res, imgfmt, layer,
 
 
 if __name__ == '__main__':
-    description = 'Check missing inputs (frames) or outputs (features)'
-    p = ArgumentParser(description=description,
-                       formatter_class=ArgumentDefaultsHelpFormatter)
-    p.add_argument('-i', '--txt-file', required=True,
-                   help='Input/Output list given to extract features')
-    p.add_argument('-o', '--output-flag', action='store_true',
-                   help='txt-file is an output list')
-    p.add_argument('-c', '--check-all-frames', action='store_false',
-                   help='Ensure all frames requested by a line are there')
-    p.add_argument('-l', '--t-res', default=16, type=int,
-                   help='temporal length of the clips')
-    p.add_argument('-f', '--imgfmt', default='{0:06d}.png',
-                   help='Image format')
-    p.add_argument('-of', '--layer', default='.fc6-1',
-                   help='Extracted layer')
-    p.add_argument('-ns', '--no-stop', action='store_true',
-                   help='Nop stop at first error')
-
-    main(**vars(p.parse_args()))
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    from c3d_misc import main as c3d_misc_main
+    c3d_misc_main(subcommand='check-c3d-list')
@@ -49,15 +49,121 @@ def dense_video_sampling(videos, annotations=None, bckg_label=201, t_res=16,
                 continue
             targets = annotations.loc[idx, ['f-init', 'f-end',
                                             'idx-label']].values
-            segments = np.empty((num_clips, 2), dtype=int)
-            segments[:, 0] = f_j
-            segments[:, 1] = f_j + t_res - 1
+            index_labels = _label_clips(f_j, targets, t_res, bckg_label)
 
-            # Assign label to clips with overlap >= t_res/2 to instances
-            overlap = intersection_area(targets[:, 0:2], segments)
-            idx_target = np.argmax(overlap, axis=0)
-            index_labels = targets[idx_target, 2]
-            index_labels[overlap.max(axis=0) < t_res/2] = bckg_label
+        clips.append(
+            pd.DataFrame(
+                OrderedDict([('video-name', [video_name]*num_clips),
+                             ('f-init', f_j),
+                             ('idx-label', index_labels)])))
+
+    clips_df = pd.concat(clips, ignore_index=True, copy=False)
+    return clips_df
+
+
+def adaptive_video_sampling(videos, annotations=None, scores=None,
+                            bckg_label=201, t_res=16, t_stride=64,
+                            fine_stride=8, margin=32, threshold=0.5,
+                            boundaries_from='annotations'):
+    """Sample clips densely around action boundaries and sparsely elsewhere.
+
+    Boundaries come from annotations (f-init, f-end) or, if they are not
+    available e.g. testing videos, from a coarse first-pass score. Frames
+    within `margin` frames of a boundary are sampled every `fine_stride`
+    frames, the rest of the video every `t_stride` frames.
+
+    Use `boundaries_from='scores'` on evaluation subsets, otherwise the
+    position of the clips leaks the ground-truth boundaries.
+
+    Parameters
+    ----------
+    videos : pandas.DataFrame
+        Table with info about videos in dataset i.e. unique entry per video.
+        Required columns are video-name, num-frames.
+    annotations : pandas.DataFrame, optional
+        Used to find boundaries and to set label of clips.
+        Required columns are video-name, idx-label, f-init, f-end.
+    scores : pandas.DataFrame, optional
+        Coarse first-pass score e.g. actionness of clips. Required columns
+        are video-name, f-init, score. Boundaries are placed between
+        consecutive clips whose score crosses `threshold`. Only used for
+        videos without annotations.
+    bckg_label : int
+        Integer for background instances.
+    t_res : int
+        Temporal resolution of clips. It is given in terms of number of frames.
+    t_stride : int
+        Stride used far from boundaries.
+    fine_stride : int
+        Stride used close to boundaries.
+    margin : int
+        Number of frames around a boundary sampled with `fine_stride`.
+    threshold : float
+        Score threshold used to find boundaries.
+    boundaries_from : str
+        ('annotations' or 'scores') source of boundaries of videos with
+        annotations. With 'scores', annotations only set the label of clips
+        and videos without scores are sampled every `t_stride` frames.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Table with video-name, f-init and idx-label columns, same format of
+        `dense_video_sampling`.
+
+    Raises
+    ------
+    ValueError
+        fine_stride is not smaller than t_stride i.e. no saving over dense
+        sampling, or unknown boundaries_from.
+
+    """
+    if fine_stride >= t_stride:
+        raise ValueError('fine_stride ({}) must be smaller than t_stride '
+                         '({})'.format(fine_stride, t_stride))
+    if boundaries_from not in ['annotations', 'scores']:
+        raise ValueError('Unknown boundaries_from {}'.format(boundaries_from))
+    if annotations is not None:
+        annotations = annotations.groupby('video-name')
+    if scores is not None:
+        scores = scores.groupby('video-name')
+
+    clips = []
+    for _, video in videos.iterrows():
+        video_name, num_frames = video['video-name'], video['num-frames']
+        last = num_frames - t_res + 1
+        targets = None
+        if annotations is not None and video_name in annotations.groups:
+            targets = annotations.get_group(video_name).loc[
+                :, ['f-init', 'f-end', 'idx-label']].values
+
+        if targets is not None and boundaries_from == 'annotations':
+            boundaries = targets[:, 0:2].ravel()
+        elif scores is not None and video_name in scores.groups:
+            coarse = scores.get_group(video_name).sort_values('f-init')
+            f_coarse = coarse['f-init'].values
+            active = coarse['score'].values >= threshold
+            change = np.flatnonzero(active[1:] != active[:-1])
+            boundaries = (f_coarse[change] + f_coarse[change + 1] +
+                          t_res) // 2
+        elif annotations is not None and targets is None:
+            continue
+        else:
+            boundaries = np.empty(0, dtype=int)
+
+        f_j = [np.arange(1, last, t_stride, dtype=int)]
+        for b in boundaries:
+            # Clips overlapping frames [b - margin, b + margin]
+            start = max(int(b) - margin - t_res + 1, 1)
+            end = min(int(b) + margin, last - 1)
+            f_j.append(np.arange(start, end + 1, fine_stride, dtype=int))
+        f_j = np.unique(np.concatenate(f_j))
+        num_clips = len(f_j)
+
+        if targets is None:
+            index_labels = bckg_label * np.ones(num_clips, dtype=int)
+        else:
+            index_labels = _label_clips(f_j, targets, t_res, bckg_label)
 
         clips.append(
             pd.DataFrame(
@@ -69,6 +175,84 @@ def dense_video_sampling(videos, annotations=None, bckg_label=201, t_res=16,
     return clips_df
 
 
+def subsample_clips(clips, bckg_label=201, bckg_ratio=None, max_clips=None,
+                    budget=None, seed=0):
+    """Select a subset of the clips sampled by `dense_video_sampling`.
+
+    Strategies are applied in the following order, and the relative order
+    of the clips is preserved.
+
+    Parameters
+    ----------
+    clips : pandas.DataFrame
+        Table with video-name, f-init and idx-label columns.
+    bckg_label : int
+        Integer for background instances.
+    bckg_ratio : float, optional
+        Keep all foreground clips but only this fraction of the background
+        clips of each video.
+    max_clips : int, optional
+        Maximum number of clips per video. Foreground clips are preferred.
+    budget : int, optional
+        Maximum number of clips in total. It is distributed among labels
+        proportionally to their number of clips (stratified sampling).
+    seed : int
+        Seed of random number generator. Output is deterministic given it.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Subset of clips.
+
+    """
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({'video-name': clips['video-name'].values,
+                       'idx-label': clips['idx-label'].values,
+                       'priority': rng.rand(len(clips))})
+    df['bckg'] = df['idx-label'] == bckg_label
+    keep = np.ones(len(df), dtype=bool)
+
+    if bckg_ratio is not None:
+        # Keep the round(ratio * n) background clips with lowest priority
+        bckg = df.loc[df['bckg']].sort_values('priority')
+        rank = bckg.groupby('video-name', sort=False).cumcount()
+        quota = (bckg.groupby('video-name')['bckg'].transform('size') *
+                 bckg_ratio).round()
+        keep[bckg.index[rank.values >= quota.values]] = False
+
+    if max_clips is not None:
+        kept = df.loc[keep].sort_values(['bckg', 'priority'])
+        rank = kept.groupby('video-name', sort=False).cumcount()
+        keep[kept.index[rank.values >= max_clips]] = False
+
+    if budget is not None and keep.sum() > budget:
+        kept = df.loc[keep].sort_values('priority')
+        counts = kept['idx-label'].value_counts()
+        share = counts * float(budget) / counts.sum()
+        quota = np.floor(share).astype(int)
+        # Largest remainder method to use the whole budget
+        remainder = (share - quota).sort_values(ascending=False)
+        quota.loc[remainder.index[:budget - quota.sum()]] += 1
+        rank = kept.groupby('idx-label', sort=False).cumcount()
+        limit = kept['idx-label'].map(quota)
+        keep[kept.index[rank.values >= limit.values]] = False
+
+    return clips.loc[keep]
+
+
+def _label_clips(f_j, targets, t_res, bckg_label):
+    """Assign label to clips with overlap >= t_res/2 to instances."""
+    segments = np.empty((len(f_j), 2), dtype=int)
+    segments[:, 0] = f_j
+    segments[:, 1] = f_j + t_res - 1
+
+    overlap = intersection_area(targets[:, 0:2], segments)
+    idx_target = np.argmax(overlap, axis=0)
+    index_labels = targets[idx_target, 2]
+    index_labels[overlap.max(axis=0) < t_res/2] = bckg_label
+    return index_labels
+
+
 def intersection_area(target_segments, test_segments):
     """Compute area/length of overlap btw segments.
 
@@ -150,3 +334,244 @@ def iou(target_segments, test_segments):
         # over union of two segments at the frame level.
         iou[i, :] = intersection / union
     return iou
+
+
+def frame_to_clip_index(clip_starts, num_frames):
+    """Map every frame to the index of the first clip starting at or after it.
+
+    Parameters
+    ----------
+    clip_starts : ndarray
+        1d-ndarray with sorted initial frame of clips (f-init).
+    num_frames : int
+        Last frame of the video.
+
+    Returns
+    -------
+    index : ndarray
+        1d-ndarray of size [num_frames + 2]. Number of clips starting before
+        frame f is index[f].
+
+    """
+    return np.searchsorted(clip_starts, np.arange(num_frames + 2),
+                           side='left')
+
+
+def proposal_clip_ranges(proposals, clip_starts, t_res=16, num_frames=None):
+    """Return range of clips fully contained inside temporal proposals.
+
+    Proposals shorter than a clip, or without any clip inside, are assigned
+    to the clip closest to their center.
+
+    Parameters
+    ----------
+    proposals : ndarray
+        2d-ndarray of size [m, 2] with format [f-init, f-end].
+    clip_starts : ndarray
+        1d-ndarray with sorted initial frame of clips.
+    t_res : int
+        Temporal resolution of clips.
+    num_frames : int, optional
+        Last frame of the video. By default, last frame of the last clip.
+
+    Returns
+    -------
+    ranges : ndarray
+        2d-ndarray of size [m, 2] with format [first-clip, last-clip + 1].
+
+    """
+    n_clips = len(clip_starts)
+    if num_frames is None:
+        num_frames = int(clip_starts[-1]) + t_res
+    index = frame_to_clip_index(clip_starts, num_frames)
+    last = len(index) - 1
+    f_init = proposals[:, 0].astype(int).clip(0, last)
+    f_last_start = (proposals[:, 1].astype(int) - t_res + 2).clip(0, last)
+    ranges = np.empty((len(proposals), 2), dtype=int)
+    ranges[:, 0], ranges[:, 1] = index[f_init], index[f_last_start]
+
+    empty = ranges[:, 1] <= ranges[:, 0]
+    if empty.any():
+        # Clip whose start is the closest to a clip centered on them
+        center = ((proposals[empty, 0] + proposals[empty, 1] - t_res) //
+                  2 + 1).astype(int)
+        after = index[(center + 1).clip(0, last)].clip(0, n_clips - 1)
+        before = (after - 1).clip(0, n_clips - 1)
+        nearest = np.where(np.abs(clip_starts[before] - center) <=
+                           np.abs(clip_starts[after] - center),
+                           before, after)
+        ranges[empty, 0], ranges[empty, 1] = nearest, nearest + 1
+    return ranges
+
+
+def pool_proposal_features(features, clip_starts, proposals, t_res=16,
+                           method='mean', pyramid=(1, 2, 4),
+                           num_frames=None):
+    """Pool clip features into a descriptor per temporal proposal.
+
+    Parameters
+    ----------
+    features : ndarray
+        ndarray of size [n, ...] with the features of the clips of a video.
+    clip_starts : ndarray
+        1d-ndarray of size [n] with sorted initial frame of clips e.g.
+        f-init column of `dense_video_sampling`.
+    proposals : ndarray
+        2d-ndarray of size [m, 2] with format [f-init, f-end].
+    t_res : int
+        Temporal resolution of clips.
+    method : str
+        ('mean', 'max' or 'pyramid') pooling strategy. pyramid concatenates
+        the mean over 1, 2, ... equal parts of the proposal.
+    pyramid : tuple
+        Number of parts of each level of the pyramid.
+    num_frames : int, optional
+        Last frame of the video.
+
+    Returns
+    -------
+    descriptors : ndarray
+        2d-ndarray of size [m, d] or [m, d * sum(pyramid)] for pyramid. It
+        has the dtype of features if they are floating point, float64
+        otherwise.
+
+    Raises
+    ------
+    ValueError
+        Unknown method.
+
+    Notes
+    -----
+    mean and pyramid use prefix sums over clips, thus the cost is linear in
+    the number of clips plus the number of proposals.
+
+    """
+    features = features.reshape(len(features), -1)
+    ranges = proposal_clip_ranges(proposals, clip_starts, t_res, num_frames)
+    start, end = ranges[:, 0], ranges[:, 1]
+
+    if method == 'max':
+        if len(proposals) == 0:
+            return features[:0]
+        # reduceat over interleaved [start, end) pairs. Pad a row such that
+        # end is always a valid index.
+        padded = np.concatenate([features, features[-1:]])
+        bounds = np.column_stack([start, end]).ravel()
+        return np.maximum.reduceat(padded, bounds, axis=0)[::2]
+
+    if method == 'mean':
+        levels = (1,)
+    elif method == 'pyramid':
+        levels = pyramid
+    else:
+        raise ValueError('Unknown pooling method {}'.format(method))
+
+    # Prefix sums, and output, keep the (floating) dtype of the features
+    dtype = features.dtype if features.dtype.kind == 'f' else np.float64
+    d = features.shape[1]
+    prefix = np.zeros((len(features) + 1, d), dtype=dtype)
+    np.cumsum(features, axis=0, out=prefix[1:])
+
+    length = end - start
+    descriptors = np.empty((len(proposals), d * sum(levels)), dtype=dtype)
+    cell = 0
+    for k in levels:
+        for j in range(k):
+            s_j = start + length * j // k
+            e_j = np.maximum(start + length * (j + 1) // k, s_j + 1)
+            out = descriptors[:, cell * d:(cell + 1) * d]
+            np.subtract(prefix[e_j], prefix[s_j], out=out)
+            out /= (e_j - s_j)[:, None].astype(dtype)
+            cell += 1
+    return descriptors
+
+
+def iter_pool_dataset_features(features, proposals, clip_starts=None,
+                               t_stride=16, **kwargs):
+    """Pool clip features of the proposals of many videos, video by video.
+
+    Only the descriptors of a video are in memory at a time, thus it scales
+    to datasets whose descriptors do not fit in memory.
+
+    Parameters
+    ----------
+    features : dict-like
+        Map video-name to ndarray with the features of its clips e.g. dict
+        built with `dump_hdf5.read_hdf5_features`.
+    proposals : pandas.DataFrame
+        Table with video-name, f-init and f-end columns.
+    clip_starts : dict-like, optional
+        Map video-name to initial frame of its clips. By default, clips
+        follow the grid of `dense_video_sampling` i.e. 1 + t_stride * i.
+    t_stride : int
+        Temporal stride used to sample clips.
+    **kwargs
+        Extra arguments for `pool_proposal_features`.
+
+    Yields
+    ------
+    video_name : str
+        Name of the video.
+    index : ndarray
+        1d-ndarray with the positions of its proposals in proposals.
+    descriptors : ndarray
+        2d-ndarray with a row per proposal of the video.
+
+    """
+    groups = proposals.groupby('video-name', sort=False).indices
+    segments = proposals.loc[:, ['f-init', 'f-end']].values
+    for video_name, idx in groups.items():
+        arr = features[video_name]
+        if clip_starts is None:
+            f_j = 1 + t_stride * np.arange(len(arr))
+        else:
+            f_j = np.asarray(clip_starts[video_name])
+        yield video_name, idx, pool_proposal_features(
+            arr, f_j, segments[idx], **kwargs)
+
+
+def pool_dataset_features(features, proposals, clip_starts=None, t_stride=16,
+                          out=None, **kwargs):
+    """Pool clip features into a descriptor per proposal of many videos.
+
+    Parameters
+    ----------
+    features : dict-like
+        Map video-name to ndarray with the features of its clips e.g. dict
+        built with `dump_hdf5.read_hdf5_features`.
+    proposals : pandas.DataFrame
+        Table with video-name, f-init and f-end columns.
+    clip_starts : dict-like, optional
+        Map video-name to initial frame of its clips. By default, clips
+        follow the grid of `dense_video_sampling` i.e. 1 + t_stride * i.
+    t_stride : int
+        Temporal stride used to sample clips.
+    out : ndarray, optional
+        2d-ndarray with a row per proposal where descriptors are written.
+        Use a `numpy.memmap` when descriptors do not fit in memory. By
+        default, a new array is allocated.
+    **kwargs
+        Extra arguments for `pool_proposal_features`.
+
+    Returns
+    -------
+    descriptors : ndarray
+        2d-ndarray with a row per proposal, same order as proposals. It is
+        out if given.
+
+    Raises
+    ------
+    ValueError
+        There are no proposals, thus the size of descriptors is unknown.
+
+    """
+    if len(proposals) == 0:
+        raise ValueError('Empty proposals table')
+
+    for _, idx, pooled in iter_pool_dataset_features(
+            features, proposals, clip_starts, t_stride, **kwargs):
+        if out is None:
+            out = np.empty((len(proposals), pooled.shape[1]),
+                           dtype=pooled.dtype)
+        out[idx] = pooled
+    return out